@@ -110,17 +110,13 @@ def _compute_log_a_int(q, sigma, alpha):
   """Compute log(A_alpha) for integer alpha. 0 < q < 1."""
   assert isinstance(alpha, six.integer_types)
 
-  # Initialize with 0 in the log space.
-  log_a = -np.inf
+  # Sum the alpha + 1 binomial terms at once in the log space.
+  i = np.arange(alpha + 1)
+  log_coef = (
+      _log_comb(alpha, i) + i * math.log(q) + (alpha - i) * math.log(1 - q))
+  s = log_coef + (i * i - i) / (2 * (sigma**2))
 
-  for i in range(alpha + 1):
-    log_coef_i = (
-        _log_comb(alpha, i) + i * math.log(q) + (alpha - i) * math.log(1 - q))
-
-    s = log_coef_i + (i * i - i) / (2 * (sigma**2))
-    log_a = _log_add(log_a, s)
-
-  return float(log_a)
+  return float(special.logsumexp(s))
 
 
 def _compute_log_a_frac(q, sigma, alpha):
@@ -192,10 +188,11 @@ def _compute_delta(orders, rdp, eps):
   Args:
     orders: An array (or a scalar) of orders.
     rdp: A list (or a scalar) of RDP guarantees.
-    eps: The target epsilon.
+    eps: The target epsilon, or a 1-D array of target epsilons.
 
   Returns:
-    Pair of (delta, optimal_order).
+    Pair of (delta, optimal_order). If `eps` is an array, these are arrays with
+    one entry per target epsilon.
 
   Raises:
     ValueError: If input is malformed.
@@ -203,37 +200,46 @@ def _compute_delta(orders, rdp, eps):
   """
   orders_vec = np.atleast_1d(orders)
   rdp_vec = np.atleast_1d(rdp)
+  eps_vec = np.atleast_1d(eps)
 
-  if eps < 0:
+  if np.any(eps_vec < 0):
     raise ValueError("Value of privacy loss bound epsilon must be >=0.")
   if len(orders_vec) != len(rdp_vec):
     raise ValueError("Input lists must have the same length.")
+  if np.any(orders_vec < 1):
+    raise ValueError("Renyi divergence order must be >=1.")
+  if np.any(rdp_vec < 0):
+    raise ValueError("Renyi divergence must be >=0.")
+
+  # Broadcast orders along the first axis and targets along the second one.
+  a = orders_vec[:, np.newaxis]
+  r = rdp_vec[:, np.newaxis]
 
   # Basic bound (see https://arxiv.org/abs/1702.07476 Proposition 3 in v3):
   #   delta = min( np.exp((rdp_vec - eps) * (orders_vec - 1)) )
 
   # Improved bound from https://arxiv.org/abs/2004.00010 Proposition 12 (in v4):
-  logdeltas = []  # work in log space to avoid overflows
-  for (a, r) in zip(orders_vec, rdp_vec):
-    if a < 1:
-      raise ValueError("Renyi divergence order must be >=1.")
-    if r < 0:
-      raise ValueError("Renyi divergence must be >=0.")
+  # work in log space to avoid overflows.
+  with np.errstate(divide="ignore", invalid="ignore"):
     # For small alpha, we are better of with bound via KL divergence:
     # delta <= sqrt(1-exp(-KL)).
     # Take a min of the two bounds.
-    logdelta = 0.5 * math.log1p(-math.exp(-r))
-    if a > 1.01:
-      # This bound is not numerically stable as alpha->1.
-      # Thus we have a min value for alpha.
-      # The bound is also not useful for small alpha, so doesn't matter.
-      rdp_bound = (a - 1) * (r - eps + math.log1p(-1 / a)) - math.log(a)
-      logdelta = min(logdelta, rdp_bound)
-
-    logdeltas.append(logdelta)
-
-  idx_opt = np.argmin(logdeltas)
-  return min(math.exp(logdeltas[idx_opt]), 1.), orders_vec[idx_opt]
+    logdeltas = 0.5 * np.log1p(-np.exp(-r))
+    rdp_bound = (a - 1) * (r - eps_vec + np.log1p(-1 / a)) - np.log(a)
+  # At alpha = inf, use the limit of the second bound: (r, 0)-DP implies
+  # (eps, 0)-DP for eps >= r; otherwise it provides no bound.
+  rdp_bound = np.where(
+      np.isinf(a), np.where(r <= eps_vec, -np.inf, np.inf), rdp_bound)
+  # The second bound is not numerically stable as alpha->1.
+  # Thus we have a min value for alpha.
+  # The bound is also not useful for small alpha, so doesn't matter.
+  logdeltas = np.where(a > 1.01, np.fmin(logdeltas, rdp_bound), logdeltas)
+
+  idx_opt = np.argmin(logdeltas, axis=0)
+  deltas = np.minimum(np.exp(logdeltas[idx_opt, np.arange(len(eps_vec))]), 1.)
+  if np.ndim(eps) == 0:
+    return float(deltas[0]), orders_vec[idx_opt[0]]
+  return deltas, orders_vec[idx_opt]
 
 
 def _compute_eps(orders, rdp, delta):
@@ -242,10 +248,11 @@ def _compute_eps(orders, rdp, delta):
   Args:
     orders: An array (or a scalar) of orders.
     rdp: A list (or a scalar) of RDP guarantees.
-    delta: The target delta.
+    delta: The target delta, or a 1-D array of target deltas.
 
   Returns:
-    Pair of (eps, optimal_order).
+    Pair of (eps, optimal_order). If `delta` is an array, these are arrays with
+    one entry per target delta.
 
   Raises:
     ValueError: If input is malformed.
@@ -253,40 +260,44 @@ def _compute_eps(orders, rdp, delta):
   """
   orders_vec = np.atleast_1d(orders)
   rdp_vec = np.atleast_1d(rdp)
+  delta_vec = np.atleast_1d(delta)
 
-  if delta <= 0:
+  if np.any(delta_vec <= 0):
     raise ValueError("Privacy failure probability bound delta must be >0.")
   if len(orders_vec) != len(rdp_vec):
     raise ValueError("Input lists must have the same length.")
+  if np.any(orders_vec < 1):
+    raise ValueError("Renyi divergence order must be >=1.")
+  if np.any(rdp_vec < 0):
+    raise ValueError("Renyi divergence must be >=0.")
+
+  # Broadcast orders along the first axis and targets along the second one.
+  a = orders_vec[:, np.newaxis]
+  r = rdp_vec[:, np.newaxis]
 
   # Basic bound (see https://arxiv.org/abs/1702.07476 Proposition 3 in v3):
   #   eps = min( rdp_vec - math.log(delta) / (orders_vec - 1) )
 
   # Improved bound from https://arxiv.org/abs/2004.00010 Proposition 12 (in v4).
   # Also appears in https://arxiv.org/abs/2001.05990 Equation 20 (in v1).
-  eps_vec = []
-  for (a, r) in zip(orders_vec, rdp_vec):
-    if a < 1:
-      raise ValueError("Renyi divergence order must be >=1.")
-    if r < 0:
-      raise ValueError("Renyi divergence must be >=0.")
-
-    if delta**2 + math.expm1(-r) >= 0:
-      # In this case, we can simply bound via KL divergence:
-      # delta <= sqrt(1-exp(-KL)).
-      eps = 0  # No need to try further computation if we have eps = 0.
-    elif a > 1.01:
-      # This bound is not numerically stable as alpha->1.
-      # Thus we have a min value of alpha.
-      # The bound is also not useful for small alpha, so doesn't matter.
-      eps = r + math.log1p(-1 / a) - math.log(delta * a) / (a - 1)
-    else:
-      # In this case we can't do anything. E.g., asking for delta = 0.
-      eps = np.inf
-    eps_vec.append(eps)
-
-  idx_opt = np.argmin(eps_vec)
-  return max(0, eps_vec[idx_opt]), orders_vec[idx_opt]
+  with np.errstate(divide="ignore", invalid="ignore"):
+    eps_mat = r + np.log1p(-1 / a) - np.log(delta_vec * a) / (a - 1)
+  # At alpha = inf, the limit of the bound is eps = r (pure DP).
+  eps_mat = np.where(np.isinf(a), r, eps_mat)
+  # This bound is not numerically stable as alpha->1.
+  # Thus we have a min value of alpha.
+  # The bound is also not useful for small alpha, so doesn't matter.
+  # Below it we can't do anything. E.g., asking for delta = 0.
+  eps_mat = np.where(a > 1.01, eps_mat, np.inf)
+  # If delta**2 + expm1(-r) >= 0, we can simply bound via KL divergence:
+  # delta <= sqrt(1-exp(-KL)), and eps = 0.
+  eps_mat = np.where(delta_vec**2 + np.expm1(-r) >= 0, 0., eps_mat)
+
+  idx_opt = np.argmin(eps_mat, axis=0)
+  eps_opt = np.fmax(0, eps_mat[idx_opt, np.arange(len(delta_vec))])
+  if np.ndim(delta) == 0:
+    return eps_opt[0], orders_vec[idx_opt[0]]
+  return eps_opt, orders_vec[idx_opt]
 
 
 def _stable_inplace_diff_in_log(vec, signs, n=-1):
@@ -373,9 +384,38 @@ def _compute_rdp(q, sigma, alpha):
   if np.isinf(alpha):
     return np.inf
 
+  if alpha == 1:
+    raise ValueError("RDP of the Sampled Gaussian mechanism with 0 < q < 1 is "
+                     "only computed for orders > 1.")
+
   return _compute_log_a(q, sigma, alpha) / (alpha - 1)
 
 
+def _compute_rdp_vec(q, sigma, alphas):
+  """Compute RDP of the Sampled Gaussian mechanism at an array of orders.
+
+  The cases q == 0 and q == 1 are evaluated for all orders at once; otherwise
+  each order is evaluated by `_compute_rdp`.
+
+  Args:
+    q: The sampling rate.
+    sigma: The std of the additive Gaussian noise.
+    alphas: A 1-D array of orders at which RDP is computed.
+
+  Returns:
+    RDP at all alphas, can contain np.inf.
+  """
+  alphas = np.asarray(alphas, dtype=float)
+
+  if q == 0:
+    return np.zeros_like(alphas)
+
+  if q == 1.:
+    return alphas / (2 * sigma**2)
+
+  return np.array([_compute_rdp(q, sigma, alpha) for alpha in alphas])
+
+
 def compute_rdp(q, noise_multiplier, steps, orders):
   """Computes RDP of the Sampled Gaussian Mechanism.
 
@@ -387,13 +427,13 @@ def compute_rdp(q, noise_multiplier, steps, orders):
     orders: An array (or a scalar) of RDP orders.
 
   Returns:
-    The RDPs at all orders. Can be `np.inf`.
+    The RDPs at all orders, as a `np.ndarray` unless `orders` is a scalar. Can
+    be `np.inf`.
   """
   if np.isscalar(orders):
     rdp = _compute_rdp(q, noise_multiplier, orders)
   else:
-    rdp = np.array(
-        [_compute_rdp(q, noise_multiplier, order) for order in orders])
+    rdp = _compute_rdp_vec(q, noise_multiplier, orders)
 
   return rdp * steps
 
@@ -635,14 +675,15 @@ def get_privacy_spent(orders, rdp, target_eps=None, target_delta=None):
   Args:
     orders: An array (or a scalar) of RDP orders.
     rdp: An array of RDP values. Must be of the same length as the orders list.
-    target_eps: If not `None`, the epsilon for which we compute the
-      corresponding delta.
-    target_delta: If not `None`, the delta for which we compute the
-      corresponding epsilon. Exactly one of `target_eps` and `target_delta` must
-      be `None`.
+    target_eps: If not `None`, the epsilon (or a 1-D array of epsilons) for
+      which we compute the corresponding delta.
+    target_delta: If not `None`, the delta (or a 1-D array of deltas) for which
+      we compute the corresponding epsilon. Exactly one of `target_eps` and
+      `target_delta` must be `None`.
 
   Returns:
-    A tuple of epsilon, delta, and the optimal order.
+    A tuple of epsilon, delta, and the optimal order. If the target is an
+    array (or a list), all three entries are arrays of the same length.
 
   Raises:
     ValueError: If target_eps and target_delta are messed up.
@@ -656,8 +697,12 @@ def get_privacy_spent(orders, rdp, target_eps=None, target_delta=None):
         "Exactly one out of eps and delta must be None. (None is).")
 
   if target_eps is not None:
+    if not np.isscalar(target_eps):
+      target_eps = np.asarray(target_eps)
     delta, opt_order = _compute_delta(orders, rdp, target_eps)
     return target_eps, delta, opt_order
   else:
+    if not np.isscalar(target_delta):
+      target_delta = np.asarray(target_delta)
     eps, opt_order = _compute_eps(orders, rdp, target_delta)
     return eps, target_delta, opt_order
@@ -18,65 +18,126 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
-import math
+import functools
+import os
 import sys
+import unittest
 
 from absl.testing import parameterized
 from mpmath import exp
+from mpmath import fsum
 from mpmath import inf
 from mpmath import log
+from mpmath import mp
+from mpmath import mpf
 from mpmath import npdf
+from mpmath import pi
 from mpmath import quad
+from mpmath import sqrt
 import numpy as np
+from scipy import special
 import tensorflow as tf
 
 from tensorflow_privacy.privacy.analysis import rdp_accountant
 
+# The multi-precision verification is slow, so it only runs when the
+# TFP_RUN_MP_TESTS environment variable is set (e.g., in nightly runs).
+_RUN_MP_TESTS = bool(os.environ.get('TFP_RUN_MP_TESTS'))
+# Precision (in decimal digits) of the multi-precision reference computations.
+# Despite rtol=1e-4, a lower precision is not enough: for tiny q, log(A_alpha)
+# is a small difference of order 1 numbers (e.g., ~1e-9 for q=1e-6).
+_MP_DPS = 15
+# Maximal degree of the tanh-sinh quadrature used by `quad`.
+_QUAD_MAX_DEGREE = 8
+# Gauss-Hermite nodes and weights for expectations under a Gaussian.
+_HERMGAUSS_NODES, _HERMGAUSS_WEIGHTS = np.polynomial.hermite.hermgauss(200)
+# The 200 nodes reach about +-28 sigma, but the rule integrates accurately only
+# what is well approximated by a polynomial times the Gaussian weight. The
+# factor exp(alpha * z / sigma^2) in the integrand of A_alpha shifts its mass by
+# up to alpha / sigma standard deviations and is poorly approximated as this
+# ratio grows: the relative error on log(A_alpha) is ~1e-14 for
+# alpha / sigma = 2.6, ~1e-6 for 10 and ~6% for 27. Gauss-Hermite quadrature is
+# thus only used up to a ratio of 5.
+_HERMGAUSS_MAX_SHIFT = 5
+# Fine set of orders 1.000, 1.001, ..., 99.999. Scaling an integer range avoids
+# the accumulation of rounding errors of a float step.
+_FINE_ORDERS = np.arange(1000, 100000) * 0.001
+# Orders at which tree aggregation privacy is evaluated.
+_TREE_ORDERS = np.concatenate([1 + np.arange(1, 100) / 10., np.arange(12, 64)])
+
 
 class TestGaussianMoments(tf.test.TestCase, parameterized.TestCase):
+
+  def setUp(self):
+    super(TestGaussianMoments, self).setUp()
+    # The mpmath precision is global state. Set it for every test so that the
+    # tests do not depend on their execution order and can be sharded or run
+    # in parallel worker processes.
+    self._orig_dps = mp.dps
+    mp.dps = _MP_DPS
+
+  def tearDown(self):
+    mp.dps = self._orig_dps
+    super(TestGaussianMoments, self).tearDown()
+
   #################################
   # HELPER FUNCTIONS:             #
   # Exact computations using      #
   # multi-precision arithmetic.   #
   #################################
 
-  def _log_float_mp(self, x):
+  @staticmethod
+  def _log_float_mp(x):
     # Convert multi-precision input to float log space.
     if x >= sys.float_info.min:
       return float(log(x))
     else:
       return -np.inf
 
-  def _integral_mp(self, fn, bounds=(-inf, inf)):
-    integral, _ = quad(fn, bounds, error=True, maxdegree=8)
-    return integral
-
-  def _distributions_mp(self, sigma, q):
-
-    def _mu0(x):
-      return npdf(x, mu=0, sigma=sigma)
+  @staticmethod
+  def _integral_mp(fn, bounds=(-inf, inf)):
+    # mpmath caches the tanh-sinh nodes across calls at a given precision.
+    return quad(fn, bounds, error=False, maxdegree=_QUAD_MAX_DEGREE)
+
+  @staticmethod
+  def _gaussian_expectation_mp(fn, sigma):
+    # Compute E[fn(Z)] for Z ~ N(0, sigma^2) by Gauss-Hermite quadrature.
+    integral = fsum(
+        mpf(w) * fn(sqrt(2) * sigma * mpf(x))
+        for x, w in zip(_HERMGAUSS_NODES, _HERMGAUSS_WEIGHTS))
+    return integral / sqrt(pi)
+
+  @classmethod
+  def _compute_a_mp(cls, sigma, q, alpha):
+    """Compute A_alpha for arbitrary alpha by numerical integration."""
+    # With mu0 = N(0, sigma^2), mu1 = N(1, sigma^2) and mu = (1-q)*mu0 + q*mu1,
+    # mu(z) / mu0(z) = (1 - q) + q * exp((2 * z - 1) / (2 * sigma^2)).
+    two_sigma_sq = 2 * sigma**2
 
-    def _mu1(x):
-      return npdf(x, mu=1, sigma=sigma)
+    def ratio_pow(z):
+      # (mu(z) / mu0(z))^alpha.
+      return ((1 - q) + q * exp((2 * z - 1) / two_sigma_sq))**alpha
 
-    def _mu(x):
-      return (1 - q) * _mu0(x) + q * _mu1(x)
+    if alpha <= _HERMGAUSS_MAX_SHIFT * sigma:
+      # A_alpha = E[(mu(Z) / mu0(Z))^alpha] for Z ~ mu0.
+      return cls._gaussian_expectation_mp(ratio_pow, sigma)
 
-    return _mu0, _mu  # Closure!
+    def a_alpha_fn(z):
+      return npdf(z, 0, sigma) * ratio_pow(z)
 
-  def _mu1_over_mu0(self, x, sigma):
-    # Closed-form expression for N(1, sigma^2) / N(0, sigma^2) at x.
-    return exp((2 * x - 1) / (2 * sigma**2))
+    return cls._integral_mp(a_alpha_fn)
 
-  def _mu_over_mu0(self, x, q, sigma):
-    return (1 - q) + q * self._mu1_over_mu0(x, sigma)
+  @staticmethod
+  @functools.lru_cache(maxsize=None)
+  def _gaussian_rdp_fine():
+    """Returns a fine set of orders and the RDP of a Gaussian at these orders.
 
-  def _compute_a_mp(self, sigma, q, alpha):
-    """Compute A_alpha for arbitrary alpha by numerical integration."""
-    mu0, _ = self._distributions_mp(sigma, q)
-    a_alpha_fn = lambda z: mu0(z) * self._mu_over_mu0(z, q, sigma)**alpha
-    a_alpha = self._integral_mp(a_alpha_fn)
-    return a_alpha
+    The noise scale is chosen to obtain exactly (1, 1e-6)-DP. The result is
+    shared by several tests, so the returned RDP array is read-only.
+    """
+    rdp = rdp_accountant.compute_rdp(1, 4.530877117, 1, _FINE_ORDERS)
+    rdp.setflags(write=False)
+    return _FINE_ORDERS, rdp
 
   # TEST ROUTINES
   def test_compute_heterogeneous_rdp_different_sampling_probabilities(self):
@@ -101,6 +162,11 @@ class TestGaussianMoments(tf.test.TestCase, parameterized.TestCase):
     rdp_scalar = rdp_accountant.compute_rdp(0.1, 2, 10, 5)
     self.assertAlmostEqual(rdp_scalar, 0.07737, places=5)
 
+  @parameterized.named_parameters(('scalar', 1), ('sequence', [1, 2, 4, 8]))
+  def test_compute_rdp_order_one_raise(self, orders):
+    with self.assertRaisesRegex(ValueError, 'orders > 1'):
+      rdp_accountant.compute_rdp(0.5, 1, 100, orders)
+
   def test_compute_rdp_sequence_without_replacement(self):
     rdp_vec = rdp_accountant.compute_rdp_sample_without_replacement(
         0.01, 2.5, 50, [1.001, 1.5, 2.5, 5, 50, 100, 256, 512, 1024, np.inf])
@@ -163,6 +229,7 @@ class TestGaussianMoments(tf.test.TestCase, parameterized.TestCase):
 
   # pylint:disable=undefined-variable
   @parameterized.parameters(p for p in params)
+  @unittest.skipUnless(_RUN_MP_TESTS, 'slow mpmath verification')
   def test_compute_log_a_equals_mp(self, q, sigma, order):
     # Compare the cheap computation of log(A) with an expensive, multi-precision
     # computation.
@@ -181,10 +248,7 @@ class TestGaussianMoments(tf.test.TestCase, parameterized.TestCase):
     self.assertAlmostEqual(eps, 1.32783806176)
 
     # Second test for Gaussian noise (with no subsampling):
-    orders = [0.001 * i for i in range(1000, 100000)
-             ]  # Pick fine set of orders.
-    rdp = rdp_accountant.compute_rdp(1, 4.530877117, 1, orders)
-    # Scale is chosen to obtain exactly (1,1e-6)-DP.
+    orders, rdp = self._gaussian_rdp_fine()
     eps, _, _ = rdp_accountant.get_privacy_spent(orders, rdp, target_delta=1e-6)
     self.assertAlmostEqual(eps, 1)
 
@@ -198,18 +262,50 @@ class TestGaussianMoments(tf.test.TestCase, parameterized.TestCase):
     self.assertAlmostEqual(delta, 1e-5)
 
     # Second test for Gaussian noise (with no subsampling):
-    orders = [0.001 * i for i in range(1000, 100000)]  # Pick fine set of order.
-    rdp = rdp_accountant.compute_rdp(1, 4.530877117, 1, orders)
-    # Scale is chosen to obtain exactly (1,1e-6)-DP.
+    orders, rdp = self._gaussian_rdp_fine()
     _, delta, _ = rdp_accountant.get_privacy_spent(orders, rdp, target_eps=1)
     self.assertAlmostEqual(delta, 1e-6)
 
+  def test_get_privacy_spent_infinite_order(self):
+    orders = [2, 4, 8, np.inf]
+    rdp = rdp_accountant.compute_rdp(0.1, 1, 1, orders)
+    # The RDP at order inf is inf here, so this order carries no information
+    # and must neither be picked nor change the result of the finite orders.
+    eps, _, opt_order = rdp_accountant.get_privacy_spent(
+        orders, rdp, target_delta=1e-5)
+    eps_finite, _, opt_order_finite = rdp_accountant.get_privacy_spent(
+        orders[:-1], rdp[:-1], target_delta=1e-5)
+    self.assertEqual(eps, eps_finite)
+    self.assertEqual(opt_order, opt_order_finite)
+
+    _, delta, opt_order = rdp_accountant.get_privacy_spent(
+        orders, rdp, target_eps=1)
+    _, delta_finite, opt_order_finite = rdp_accountant.get_privacy_spent(
+        orders[:-1], rdp[:-1], target_eps=1)
+    self.assertEqual(delta, delta_finite)
+    self.assertEqual(opt_order, opt_order_finite)
+
+    # A finite RDP at order inf is a pure DP guarantee: (0.5, 0)-DP here.
+    orders = [2, 8, np.inf]
+    rdp = [0.1, 0.4, 0.5]
+    for target_eps in [0.5, 1]:
+      _, delta, opt_order = rdp_accountant.get_privacy_spent(
+          orders, rdp, target_eps=target_eps)
+      self.assertEqual(delta, 0)
+      self.assertEqual(opt_order, np.inf)
+    eps, _, opt_order = rdp_accountant.get_privacy_spent(
+        orders, rdp, target_delta=1e-5)
+    self.assertEqual(eps, 0.5)
+    self.assertEqual(opt_order, np.inf)
+
   def test_check_composition(self):
     orders = (1.25, 1.5, 1.75, 2., 2.5, 3., 4., 5., 6., 7., 8., 10., 12., 14.,
               16., 20., 24., 28., 32., 64., 256.)
 
     rdp = rdp_accountant.compute_rdp(
         q=1e-4, noise_multiplier=.4, steps=40000, orders=orders)
+    # Composition relies on vectorized addition, not list concatenation.
+    self.assertIsInstance(rdp, np.ndarray)
 
     eps, _, _ = rdp_accountant.get_privacy_spent(orders, rdp, target_delta=1e-6)
 
@@ -224,51 +320,81 @@ class TestGaussianMoments(tf.test.TestCase, parameterized.TestCase):
 
   def test_get_privacy_spent_consistency(self):
     orders = range(2, 50)  # Large range of orders (helps test for overflows).
+    deltas = np.array([.9, .5, .1, .01, 1e-3, 1e-4, 1e-5, 1e-6, 1e-9, 1e-12])
     for q in [0.01, 0.1, 0.8, 1.]:  # Different subsampling rates.
       for multiplier in [0.1, 1., 3., 10., 100.]:  # Different noise scales.
         rdp = rdp_accountant.compute_rdp(q, multiplier, 1, orders)
-        for delta in [.9, .5, .1, .01, 1e-3, 1e-4, 1e-5, 1e-6, 1e-9, 1e-12]:
-          eps1, delta1, ord1 = rdp_accountant.get_privacy_spent(
-              orders, rdp, target_delta=delta)
-          eps2, delta2, ord2 = rdp_accountant.get_privacy_spent(
-              orders, rdp, target_eps=eps1)
-          self.assertEqual(delta1, delta)
-          self.assertEqual(eps2, eps1)
-          if eps1 != 0:
-            self.assertEqual(ord1, ord2)
-            self.assertAlmostEqual(delta, delta2)
-          else:  # This is a degenerate case; we won't have consistency.
-            self.assertLessEqual(delta2, delta)
+        eps1, delta1, ord1 = rdp_accountant.get_privacy_spent(
+            orders, rdp, target_delta=deltas)
+        eps2, delta2, ord2 = rdp_accountant.get_privacy_spent(
+            orders, rdp, target_eps=eps1)
+        self.assertAllEqual(delta1, deltas)
+        self.assertAllEqual(eps2, eps1)
+        # eps1 == 0 is a degenerate case; we won't have consistency.
+        degenerate = eps1 == 0
+        self.assertAllEqual(ord1[~degenerate], ord2[~degenerate])
+        self.assertAllClose(
+            delta2[~degenerate], deltas[~degenerate], rtol=0, atol=5e-8)
+        self.assertAllLessEqual(delta2[degenerate] - deltas[degenerate], 0)
+
+  def test_get_privacy_spent_batched_equals_scalar(self):
+    orders = range(2, 50)
+    rdp = rdp_accountant.compute_rdp(0.1, 1., 1, orders)
+
+    deltas = [.5, 1e-3, 1e-6, 1e-12]
+    eps_vec, delta_vec, ord_vec = rdp_accountant.get_privacy_spent(
+        orders, rdp, target_delta=deltas)
+    self.assertIsInstance(delta_vec, np.ndarray)
+    self.assertAllEqual(delta_vec, deltas)
+    for i, delta in enumerate(deltas):
+      eps, _, opt_order = rdp_accountant.get_privacy_spent(
+          orders, rdp, target_delta=delta)
+      self.assertEqual(eps_vec[i], eps)
+      self.assertEqual(ord_vec[i], opt_order)
+
+    epsilons = [0., .5, 1., 5.]
+    eps_vec, delta_vec, ord_vec = rdp_accountant.get_privacy_spent(
+        orders, rdp, target_eps=epsilons)
+    self.assertIsInstance(eps_vec, np.ndarray)
+    self.assertAllEqual(eps_vec, epsilons)
+    for i, eps in enumerate(epsilons):
+      _, delta, opt_order = rdp_accountant.get_privacy_spent(
+          orders, rdp, target_eps=eps)
+      self.assertEqual(delta_vec[i], delta)
+      self.assertEqual(ord_vec[i], opt_order)
 
   def test_get_privacy_spent_gaussian(self):
     # Compare the optimal bound for Gaussian with the one derived from RDP.
     # Also compare the RDP upper bound with the "standard" upper bound.
     orders = [0.1 * x for x in range(10, 505)]
-    eps_vec = [0.1 * x for x in range(500)]
+    eps_vec = 0.1 * np.arange(500)
     rdp = rdp_accountant.compute_rdp(1, 1, 1, orders)
-    for eps in eps_vec:
-      _, delta, _ = rdp_accountant.get_privacy_spent(
-          orders, rdp, target_eps=eps)
-      # For comparison, we compute the optimal guarantee for Gaussian
-      # using https://arxiv.org/abs/1805.06530 Theorem 8 (in v2).
-      delta0 = math.erfc((eps - .5) / math.sqrt(2)) / 2
-      delta0 = delta0 - math.exp(eps) * math.erfc((eps + .5) / math.sqrt(2)) / 2
-      self.assertLessEqual(delta0, delta + 1e-300)  # need tolerance 10^-300
-
-      # Compute the "standard" upper bound, which should be an upper bound.
-      # Note, if orders is too sparse, this will NOT be an upper bound.
-      if eps >= 0.5:
-        delta1 = math.exp(-0.5 * (eps - 0.5)**2)
-      else:
-        delta1 = 1
-      self.assertLessEqual(delta, delta1 + 1e-300)
+    _, delta, _ = rdp_accountant.get_privacy_spent(
+        orders, rdp, target_eps=eps_vec)
+    # Compare in log space, where nothing underflows. delta itself underflows
+    # to 0 for large eps, hence the tolerance on the lower bound.
+    with np.errstate(divide='ignore'):
+      log_delta = np.log(delta)
+    # For comparison, we compute the optimal guarantee for Gaussian
+    # using https://arxiv.org/abs/1805.06530 Theorem 8 (in v2):
+    #   delta0 = Phi(.5 - eps) - exp(eps) * Phi(-.5 - eps).
+    log_t0 = special.log_ndtr(.5 - eps_vec)
+    log_t1 = eps_vec + special.log_ndtr(-.5 - eps_vec)
+    log_delta0 = log_t0 + np.log1p(-np.exp(log_t1 - log_t0))
+    self.assertAllLessEqual(
+        log_delta0 - np.logaddexp(log_delta, np.log(1e-300)), 0)
+
+    # Compute the "standard" upper bound, which should be an upper bound.
+    # Note, if orders is too sparse, this will NOT be an upper bound.
+    log_delta1 = np.where(eps_vec >= 0.5, -0.5 * (eps_vec - 0.5)**2, 0)
+    self.assertAllLessEqual(log_delta - log_delta1, 0)
 
 
 class TreeAggregationTest(tf.test.TestCase, parameterized.TestCase):
 
   @parameterized.named_parameters(('eps20', 1.13, 19.74), ('eps2', 8.83, 2.04))
   def test_compute_eps_tree(self, noise_multiplier, eps):
-    orders = [1 + x / 10. for x in range(1, 100)] + list(range(12, 64))
+    orders = _TREE_ORDERS
     # This tests is based on the StackOverflow setting in "Practical and
     # Private (Deep) Learning without Sampling or Shuffling". The calculated
     # epsilon could be better as the method in this package keeps improving.
@@ -302,7 +428,7 @@ class TreeAggregationTest(tf.test.TestCase, parameterized.TestCase):
   def test_compute_eps_tree_decreasing(self, steps_list):
     # Test privacy epsilon decreases with noise multiplier increasing when
     # keeping other parameters the same.
-    orders = [1 + x / 10. for x in range(1, 100)] + list(range(12, 64))
+    orders = _TREE_ORDERS
     target_delta = 1e-6
     prev_eps = rdp_accountant.compute_rdp_tree_restart(0, steps_list, orders)
     for noise_multiplier in [0.1 * x for x in range(1, 100, 5)]:
@@ -328,7 +454,7 @@ class TreeAggregationTest(tf.test.TestCase, parameterized.TestCase):
       ('t1000n0.01', 1000, 0.01),
   )
   def test_no_tree_no_sampling(self, total_steps, noise_multiplier):
-    orders = [1 + x / 10. for x in range(1, 100)] + list(range(12, 64))
+    orders = _TREE_ORDERS
     tree_rdp = rdp_accountant.compute_rdp_tree_restart(noise_multiplier,
                                                        [1] * total_steps,
                                                        orders)